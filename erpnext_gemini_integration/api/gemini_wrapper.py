@@ -545,18 +545,20 @@ class GeminiWrapper:
             if not function_name:
                  return {"error": True, "message": _("Function call name missing.")}
 
-            # Check if function exists
-            try:
-                function_doc = frappe.get_doc("Gemini Function", function_name)
-            except frappe.DoesNotExistError:
+            # Check if function exists, using the cached spec instead of loading the doc
+            from erpnext_gemini_integration.modules.security import get_function_spec
+            function_spec = get_function_spec(function_name)
+            if not function_spec:
                  _logger.error(f"Gemini Function DocType not found: {function_name}")
                  return {
                     "error": True,
                     "message": _("Function definition ") + f"\"{function_name}\"" + _(" not found.")
                 }
             
+            enabled, required_role, require_confirmation = function_spec
+            
             # Check if function is enabled
-            if not function_doc.enabled:
+            if not enabled:
                 _logger.warning(f"Attempted to call disabled function: {function_name}")
                 return {
                     "error": True,
@@ -581,7 +583,7 @@ class GeminiWrapper:
 
             
             # Check if function requires confirmation
-            if function_doc.require_confirmation:
+            if require_confirmation:
                 # In a real implementation, this would trigger a confirmation flow
                 # For now, we'll just log it and return an error indicating confirmation needed
                 _logger.info(f"Function {function_name} requires user confirmation.")
@@ -601,22 +603,25 @@ class GeminiWrapper:
                     func_to_call = ERPNext_FUNCTIONS[function_name]
                     # Ensure args is a dict before unpacking
                     result = func_to_call(**(function_args or {})) 
-                elif function_doc.implementation: # Fallback to executing code from doctype (DEPRECATED)
+                else: # Fallback to executing code from doctype (DEPRECATED)
+                    # Only this path needs the implementation field of the doc
+                    implementation = frappe.db.get_value("Gemini Function", function_name, "implementation")
+                    if not implementation:
+                        _logger.error(f"Function {function_name} has no implementation defined.")
+                        return {
+                            "error": True,
+                            "message": _("Function ") + f"\"{function_name}\"" + _(" has no implementation defined.")
+                        }
                     _logger.warning(f"Executing function {function_name} from DocType implementation field. This approach is deprecated - consider moving implementation to erpnext_functions.py module for better maintainability and security.")
-                    result = self._execute_function_code(function_doc.implementation, function_args, context)
-                else:
-                    _logger.error(f"Function {function_name} has no implementation defined.")
-                    return {
-                        "error": True,
-                        "message": _("Function ") + f"\"{function_name}\"" + _(" has no implementation defined.")
-                    }
+                    result = self._execute_function_code(implementation, function_args, context)
             except ImportError:
                  _logger.error("erpnext_functions module not found. Cannot execute pre-packaged functions.")
-                 if not function_doc.implementation:
+                 implementation = frappe.db.get_value("Gemini Function", function_name, "implementation")
+                 if not implementation:
                      return {"error": True, "message": _("Function implementation module missing and no fallback defined.")}
                  # If fallback exists, log warning and continue
                  _logger.warning("Falling back to DocType implementation due to missing erpnext_functions module.")
-                 result = self._execute_function_code(function_doc.implementation, function_args, context)
+                 result = self._execute_function_code(implementation, function_args, context)
 
             # Log function execution (ensure audit module exists)
             try:
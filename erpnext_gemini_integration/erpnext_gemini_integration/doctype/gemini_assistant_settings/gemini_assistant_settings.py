@@ -45,3 +45,4 @@ class GeminiAssistantSettings(Document):
     def clear_cache(self):
         """Clear cache for settings"""
         frappe.cache().delete_key("gemini_assistant_settings")
+        frappe.cache().delete_value("gemini_assistant_enabled")
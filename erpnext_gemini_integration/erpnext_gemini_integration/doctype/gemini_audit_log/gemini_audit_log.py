@@ -8,6 +8,7 @@ import frappe
 import json
 from frappe import _
 from frappe.model.document import Document
+from erpnext_gemini_integration.utils.compression import compress_text, decompress_text
 
 class GeminiAuditLog(Document):
     """
@@ -40,3 +41,24 @@ class GeminiAuditLog(Document):
         # Ensure user is set
         if not self.user:
             self.user = frappe.session.user
+        
+        # Store large prompt and response bodies compressed
+        self.prompt = compress_text(self.prompt)
+        self.response = compress_text(self.response)
+    
+    def on_update(self):
+        """Hand the saved log back to the caller uncompressed"""
+        self.decompress_bodies()
+    
+    def load_from_db(self):
+        """Load the log with prompt and response uncompressed"""
+        super().load_from_db()
+        
+        # Covers the form, get_doc callers and the REST API; frappe.get_all,
+        # list and report views still read the stored columns
+        self.decompress_bodies()
+    
+    def decompress_bodies(self):
+        """Restore compressed prompt and response bodies in place"""
+        self.prompt = decompress_text(self.prompt)
+        self.response = decompress_text(self.response)
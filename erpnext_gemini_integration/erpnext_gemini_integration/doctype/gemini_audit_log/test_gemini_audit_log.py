@@ -1,9 +1,88 @@
 # Copyright (c) 2025, Golive-Solutions and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from erpnext_gemini_integration.utils.compression import (
+	COMPRESSED_PREFIX,
+	MIN_COMPRESS_LENGTH,
+	compress_text,
+	decompress_text,
+	is_compressed,
+)
+
+LONG_TEXT = "The quarterly sales report shows steady growth across all regions. " * 20
+
 
 class TestGeminiAuditLog(FrappeTestCase):
-	pass
+	def test_round_trip(self):
+		compressed = compress_text(LONG_TEXT)
+
+		self.assertTrue(is_compressed(compressed))
+		self.assertLess(len(compressed), len(LONG_TEXT))
+		self.assertEqual(decompress_text(compressed), LONG_TEXT)
+
+	def test_short_and_empty_text_kept_as_is(self):
+		short_text = "x" * (MIN_COMPRESS_LENGTH - 1)
+
+		self.assertEqual(compress_text(short_text), short_text)
+		self.assertEqual(compress_text(""), "")
+		self.assertIsNone(compress_text(None))
+		self.assertIsNone(decompress_text(None))
+
+	def test_text_that_does_not_shrink_is_kept_as_is(self):
+		text = frappe.generate_hash(length=MIN_COMPRESS_LENGTH * 2)
+		stored = compress_text(text)
+
+		self.assertLessEqual(len(stored), len(text))
+		self.assertEqual(decompress_text(stored), text)
+
+	def test_plain_text_with_marker_passes_through(self):
+		text = COMPRESSED_PREFIX + "not base64 data! " * 30
+
+		self.assertEqual(compress_text(text), text)
+		self.assertEqual(decompress_text(text), text)
+
+	def test_compress_is_idempotent(self):
+		compressed = compress_text(LONG_TEXT)
+
+		self.assertEqual(compress_text(compressed), compressed)
+
+	def test_before_save_is_idempotent(self):
+		doc = frappe.get_doc(
+			{
+				"doctype": "Gemini Audit Log",
+				"action": "query",
+				"prompt": LONG_TEXT,
+				"response": "OK",
+			}
+		)
+
+		doc.before_save()
+		self.assertTrue(is_compressed(doc.prompt))
+		self.assertEqual(doc.response, "OK")
+
+		# A second save must not compress the stored body again
+		stored_prompt = doc.prompt
+		doc.before_save()
+		self.assertEqual(doc.prompt, stored_prompt)
+
+	def test_loaded_doc_is_uncompressed(self):
+		doc = frappe.get_doc(
+			{
+				"doctype": "Gemini Audit Log",
+				"action": "query",
+				"prompt": LONG_TEXT,
+				"response": "OK",
+			}
+		).insert(ignore_permissions=True)
+		self.assertEqual(doc.prompt, LONG_TEXT)
+
+		stored_prompt = frappe.db.get_value("Gemini Audit Log", doc.name, "prompt")
+		self.assertTrue(is_compressed(stored_prompt))
+
+		loaded = frappe.get_doc("Gemini Audit Log", doc.name)
+		self.assertEqual(loaded.prompt, LONG_TEXT)
+		self.assertEqual(loaded.as_dict().prompt, LONG_TEXT)
+		self.assertEqual(loaded.response, "OK")
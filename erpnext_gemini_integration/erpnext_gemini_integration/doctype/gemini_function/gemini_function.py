@@ -64,6 +64,24 @@ class GeminiFunction(Document):
             if func in self.implementation:
                 frappe.throw(_("Implementation contains potentially dangerous function: {0}").format(func))
     
+    def on_update(self):
+        """Actions to perform when function is updated"""
+        self.clear_function_spec_cache()
+    
+    def on_trash(self):
+        """Actions to perform when function is deleted"""
+        self.clear_function_spec_cache()
+    
+    def after_rename(self, old, new, merge=False):
+        """Actions to perform after function is renamed"""
+        from erpnext_gemini_integration.modules.security import clear_function_spec_cache
+        clear_function_spec_cache(old)
+    
+    def clear_function_spec_cache(self):
+        """Clear cached permission spec for function"""
+        from erpnext_gemini_integration.modules.security import clear_function_spec_cache
+        clear_function_spec_cache(self.name)
+    
     def execute(self, args, context=None):
         """
         Execute the function
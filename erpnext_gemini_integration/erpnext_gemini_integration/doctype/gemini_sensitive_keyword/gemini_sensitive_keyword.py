@@ -3,6 +3,14 @@
 
 # import frappe
 from frappe.model.document import Document
+from erpnext_gemini_integration.modules.security import clear_sensitive_keywords_cache
 
 class GeminiSensitiveKeyword(Document):
-	pass
+	def on_update(self):
+		clear_sensitive_keywords_cache()
+
+	def after_delete(self):
+		clear_sensitive_keywords_cache()
+
+	def after_rename(self, old, new, merge=False):
+		clear_sensitive_keywords_cache()
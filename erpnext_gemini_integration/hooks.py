@@ -34,17 +34,58 @@ doc_events = {
     "*": {
         "on_submit": "erpnext_gemini_integration.modules.workflow.on_document_submit",
         # Add other events if they were present in origin/main and needed
-    }
+    },
+    # Count active users for the hourly analysis
+    "Activity Log": {
+        "after_insert": "erpnext_gemini_integration.modules.workflow.track_active_user",
+    },
+    # Invalidate cached sensitive field masks used by GeminiSecurity
+    "Property Setter": {
+        "on_update": [
+            "erpnext_gemini_integration.modules.security.clear_sensitive_mask_cache",
+            "erpnext_gemini_integration.utils.context_manager.clear_searchable_fields_cache",
+            "erpnext_gemini_integration.utils.file_processor.clear_doctype_fields_cache",
+        ],
+        "on_trash": [
+            "erpnext_gemini_integration.modules.security.clear_sensitive_mask_cache",
+            "erpnext_gemini_integration.utils.context_manager.clear_searchable_fields_cache",
+            "erpnext_gemini_integration.utils.file_processor.clear_doctype_fields_cache",
+        ],
+    },
+    "Custom Field": {
+        "on_update": [
+            "erpnext_gemini_integration.utils.context_manager.clear_searchable_fields_cache",
+            "erpnext_gemini_integration.utils.file_processor.clear_doctype_fields_cache",
+        ],
+        "on_trash": [
+            "erpnext_gemini_integration.utils.context_manager.clear_searchable_fields_cache",
+            "erpnext_gemini_integration.utils.file_processor.clear_doctype_fields_cache",
+        ],
+    },
+    "Custom DocPerm": {
+        "on_update": "erpnext_gemini_integration.modules.security.clear_sensitive_mask_cache",
+        "on_trash": "erpnext_gemini_integration.modules.security.clear_sensitive_mask_cache",
+    },
+    "DocType": {
+        "on_update": [
+            "erpnext_gemini_integration.modules.security.clear_sensitive_mask_cache",
+            "erpnext_gemini_integration.utils.context_manager.clear_searchable_fields_cache",
+            "erpnext_gemini_integration.utils.file_processor.clear_doctype_fields_cache",
+        ],
+    },
+    "User": {
+        "on_update": "erpnext_gemini_integration.modules.security.clear_sensitive_mask_cache",
+    },
 }
 
 # Scheduled Tasks
 # ---------------
 # Keep scheduler_events from origin/main as workflow.py is kept
 scheduler_events = {
-    "daily": [
+    "daily_long": [
         "erpnext_gemini_integration.modules.workflow.run_daily_analysis",
     ],
-    "hourly": [
+    "hourly_long": [
         "erpnext_gemini_integration.modules.workflow.run_hourly_analysis",
     ],
 }
@@ -84,3 +125,7 @@ api_endpoints = [
 # Keep boot_session from origin/main
 boot_session = "erpnext_gemini_integration.utils.boot.boot_session"
 
+# Cache
+# -----
+# Drop cached field masks when the whole site cache is cleared
+clear_cache = "erpnext_gemini_integration.modules.security.clear_sensitive_mask_cache"
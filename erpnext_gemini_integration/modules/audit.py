@@ -5,8 +5,24 @@
 from __future__ import unicode_literals
 import frappe
 import json
+from collections import Counter
 from frappe import _
 from frappe.utils import cint, now_datetime
+from erpnext_gemini_integration.modules.security import ensure_sanitized
+from erpnext_gemini_integration.utils.compression import decompress_text
+
+def _decompress_log(log):
+    """
+    Restore compressed prompt and response bodies of an audit log row in place
+    
+    Args:
+        log (dict): Audit log row
+    """
+    if log.get("prompt"):
+        log.prompt = decompress_text(log.prompt)
+    
+    if log.get("response"):
+        log.response = decompress_text(log.response)
 
 class GeminiAuditLog:
     """
@@ -33,7 +49,7 @@ class GeminiAuditLog:
         
         Args:
             interaction_type (str): Type of interaction (query, function_call, document_event)
-            prompt (str): The prompt sent to Gemini
+            prompt (str or SanitizedPrompt): The sanitized prompt sent to Gemini
             response (dict): The response from Gemini
             metadata (dict, optional): Additional metadata about the interaction
             
@@ -55,7 +71,7 @@ class GeminiAuditLog:
                 audit_log.document = metadata.get("docname")
             
             # Set prompt and response
-            audit_log.prompt = prompt
+            audit_log.prompt = ensure_sanitized(prompt, self.user)
             audit_log.response = response.get("text", "") if isinstance(response, dict) else str(response)
             
             # Set actions taken if provided in metadata
@@ -78,7 +94,7 @@ class GeminiAuditLog:
             doctype (str): DocType name
             docname (str): Document name
             changes (dict): Changes made to the document
-            prompt (str, optional): The prompt that led to the change
+            prompt (str or SanitizedPrompt, optional): The sanitized prompt that led to the change
             response (dict, optional): The response that led to the change
             
         Returns:
@@ -95,7 +111,7 @@ class GeminiAuditLog:
             
             # Set prompt and response if provided
             if prompt:
-                audit_log.prompt = prompt
+                audit_log.prompt = ensure_sanitized(prompt, self.user)
             
             if response:
                 audit_log.response = response.get("text", "") if isinstance(response, dict) else str(response)
@@ -121,7 +137,7 @@ class GeminiAuditLog:
             function_name (str): Name of the function
             args (dict): Arguments passed to the function
             result (dict): Result of the function call
-            prompt (str, optional): The prompt that led to the function call
+            prompt (str or SanitizedPrompt, optional): The sanitized prompt that led to the function call
             response (dict, optional): The response that led to the function call
             
         Returns:
@@ -136,7 +152,7 @@ class GeminiAuditLog:
             
             # Set prompt and response if provided
             if prompt:
-                audit_log.prompt = prompt
+                audit_log.prompt = ensure_sanitized(prompt, self.user)
             
             if response:
                 audit_log.response = response.get("text", "") if isinstance(response, dict) else str(response)
@@ -187,6 +203,7 @@ class GeminiAuditLog:
             
             # Process logs
             for log in logs:
+                _decompress_log(log)
                 if log.actions_taken:
                     log.actions_taken = json.loads(log.actions_taken)
             
@@ -224,6 +241,7 @@ class GeminiAuditLog:
             
             # Process logs
             for log in logs:
+                _decompress_log(log)
                 if log.actions_taken:
                     log.actions_taken = json.loads(log.actions_taken)
             
@@ -233,6 +251,67 @@ class GeminiAuditLog:
             frappe.log_error(f"Error getting document audit logs: {str(e)}")
             return []
     
+    def get_document_audit_logs_bulk(self, documents, limit=20):
+        """
+        Get audit logs for several documents at once
+        
+        Args:
+            documents (list): List of (doctype, docname) pairs
+            limit (int, optional): Maximum number of logs to return per document
+            
+        Returns:
+            dict: Lists of audit logs keyed by (doctype, docname); documents the
+                user can't read are left out
+        """
+        try:
+            # Check permissions once per unique document
+            allowed = [
+                (doctype, docname)
+                for doctype, docname in dict.fromkeys(tuple(pair) for pair in documents)
+                if frappe.has_permission(doctype, "read", docname)
+            ]
+            
+            if not allowed:
+                return {}
+            
+            # Get the latest audit logs of all documents in one query, the
+            # per document limit is applied in SQL so bodies over it aren't read
+            limit = cint(limit)
+            limit_condition = "WHERE row_num <= %(limit)s" if limit else ""
+            logs = frappe.db.sql(f"""
+                SELECT name, timestamp, user, action, reference_doctype, document,
+                    prompt, response, actions_taken
+                FROM (
+                    SELECT name, timestamp, user, action, reference_doctype, document,
+                        prompt, response, actions_taken,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY reference_doctype, document
+                            ORDER BY timestamp DESC
+                        ) AS row_num
+                    FROM `tabGemini Audit Log`
+                    WHERE (reference_doctype, document) IN %(documents)s
+                ) logs
+                {limit_condition}
+                ORDER BY timestamp DESC
+            """, {"documents": tuple(allowed), "limit": limit}, as_dict=True)
+            
+            # Bucket logs by document
+            result = {pair: [] for pair in allowed}
+            for log in logs:
+                bucket = result[(log.pop("reference_doctype"), log.pop("document"))]
+                
+                _decompress_log(log)
+                if log.actions_taken:
+                    log.actions_taken = json.loads(log.actions_taken)
+                
+                bucket.append(log)
+            
+            return result
+            
+        except Exception as e:
+            frappe.log_error(f"Error getting document audit logs in bulk: {str(e)}")
+            return {}
+    
     def generate_audit_report(self, filters=None, from_date=None, to_date=None):
         """
         Generate an audit report
@@ -275,34 +354,20 @@ class GeminiAuditLog:
             
             # Process logs
             for log in logs:
+                _decompress_log(log)
                 if log.actions_taken:
                     log.actions_taken = json.loads(log.actions_taken)
             
             # Generate summary statistics
+            # Counter does the tallying in C, which keeps large compliance
+            # exports from spending their time in per-row dict updates
             summary = {
                 "total_interactions": len(logs),
-                "users": {},
-                "actions": {},
-                "doctypes": {}
+                "users": dict(Counter(log.user for log in logs)),
+                "actions": dict(Counter(log.action for log in logs)),
+                "doctypes": dict(Counter(log.doctype for log in logs if log.doctype))
             }
             
-            for log in logs:
-                # Count by user
-                if log.user not in summary["users"]:
-                    summary["users"][log.user] = 0
-                summary["users"][log.user] += 1
-                
-                # Count by action
-                if log.action not in summary["actions"]:
-                    summary["actions"][log.action] = 0
-                summary["actions"][log.action] += 1
-                
-                # Count by doctype
-                if log.doctype:
-                    if log.doctype not in summary["doctypes"]:
-                        summary["doctypes"][log.doctype] = 0
-                    summary["doctypes"][log.doctype] += 1
-            
             return {
                 "logs": logs,
                 "summary": summary
@@ -5,7 +5,7 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import getdate, nowdate, add_days
+from frappe.utils import cint, getdate, nowdate, add_days
 import json
 
 def check_stock_levels(item_code):
@@ -36,6 +36,48 @@ def check_stock_levels(item_code):
         frappe.log_error(f"Error in check_stock_levels for {item_code}: {str(e)}")
         return {"error": _("Failed to retrieve stock level for ") + f"\"{item_code}\""}
 
+def check_stock_levels_bulk(item_codes):
+    """Fetches the actual stock quantity for several item codes in a single query."""
+    try:
+        if isinstance(item_codes, str):
+            item_codes = [item_codes]
+
+        # Drop blanks and duplicates while keeping the requested order
+        item_codes = list(dict.fromkeys(code for code in (item_codes or []) if code))
+
+        if not item_codes:
+            return {"error": _("At least one item code is required.")}
+
+        # Stock is kept per warehouse in Bin; the LEFT JOIN keeps items without
+        # any Bin so only unknown codes are reported as missing
+        rows = frappe.db.sql("""
+            SELECT i.name, COALESCE(SUM(b.actual_qty), 0) AS actual_qty
+            FROM `tabItem` i
+            LEFT JOIN `tabBin` b ON b.item_code = i.name
+            WHERE i.name IN %(codes)s
+            GROUP BY i.name
+        """, {"codes": tuple(item_codes)}, as_dict=True)
+
+        stock = {row.name: row.actual_qty or 0 for row in rows}
+
+        results = []
+        for item_code in item_codes:
+            if item_code not in stock:
+                results.append({"item_code": item_code, "error": _("Item code ") + f"\"{item_code}\"" + _(" not found.")})
+                continue
+
+            results.append({
+                "item_code": item_code,
+                "actual_quantity": stock[item_code],
+                "message": _("Stock level for item ") + f"\"{item_code}\"" + _(" is ") + f"{stock[item_code]}"
+            })
+
+        return {"items": results}
+
+    except Exception as e:
+        frappe.log_error(f"Error in check_stock_levels_bulk for {item_codes}: {str(e)}")
+        return {"error": _("Failed to retrieve stock levels.")}
+
 def generate_sales_report(start_date_str=None, end_date_str=None):
     """Generates a summary sales report based on submitted Sales Orders within a date range."""
     try:
@@ -43,21 +85,19 @@ def generate_sales_report(start_date_str=None, end_date_str=None):
         end_date = getdate(end_date_str) if end_date_str else getdate(nowdate())
         start_date = getdate(start_date_str) if start_date_str else add_days(end_date, -30)
 
-        # Query submitted Sales Orders within the date range
-        sales_orders = frappe.get_all(
-            "Sales Order",
-            filters={
-                "docstatus": 1, # Submitted
-                "transaction_date": ["between", [start_date, end_date]]
-            },
-            fields=["name", "customer", "grand_total", "transaction_date"]
-        )
+        # Aggregate submitted Sales Orders within the date range in the database
+        totals = frappe.db.sql("""
+            SELECT COUNT(*) AS order_count, COALESCE(SUM(grand_total), 0) AS total_sales
+            FROM `tabSales Order`
+            WHERE docstatus = 1
+            AND transaction_date BETWEEN %s AND %s
+        """, (start_date, end_date), as_dict=True)[0]
 
-        if not sales_orders:
-            return {"message": _("No submitted Sales Orders found between ") + f"{start_date} " + _("and") + f" {end_date}."}
+        order_count = totals.order_count
+        total_sales = totals.total_sales
 
-        total_sales = sum(so.grand_total for so in sales_orders)
-        order_count = len(sales_orders)
+        if not order_count:
+            return {"message": _("No submitted Sales Orders found between ") + f"{start_date} " + _("and") + f" {end_date}."}
 
         # Prepare summary
         summary = {
@@ -76,9 +116,32 @@ def generate_sales_report(start_date_str=None, end_date_str=None):
         frappe.log_error(f"Error in generate_sales_report: {str(e)}")
         return {"error": _("Failed to generate sales report.")}
 
-def list_overdue_invoices(customer=None):
+def list_overdue_invoices(customer=None, limit=50):
     """Lists submitted Sales Invoices that are overdue."""
     try:
+        if customer:
+            if not frappe.db.exists("Customer", customer):
+                 return {"error": _("Customer ") + f"\"{customer}\"" + _(" not found.")}
+
+        # Summarise in the database rather than summing every row in Python
+        totals = frappe.db.sql("""
+            SELECT COUNT(*) AS invoice_count, COALESCE(SUM(outstanding_amount), 0) AS total_outstanding
+            FROM `tabSales Invoice`
+            WHERE docstatus = 1
+            AND status NOT IN ('Paid', 'Cancelled')
+            AND due_date < %(today)s
+            AND (%(customer)s IS NULL OR customer = %(customer)s)
+        """, {"today": nowdate(), "customer": customer or None}, as_dict=True)[0]
+
+        count = totals.invoice_count
+        total_outstanding = totals.total_outstanding
+
+        if not count:
+            msg = _("No overdue invoices found.")
+            if customer:
+                msg = _("No overdue invoices found for customer ") + f"\"{customer}\"" + _(".")
+            return {"message": msg}
+
         filters = {
             "docstatus": 1, # Submitted
             "status": ["not in", ["Paid", "Cancelled"]],
@@ -86,26 +149,17 @@ def list_overdue_invoices(customer=None):
         }
 
         if customer:
-            if not frappe.db.exists("Customer", customer):
-                 return {"error": _("Customer ") + f"\"{customer}\"" + _(" not found.")}
             filters["customer"] = customer
 
+        # Only the oldest invoices are listed; count and total cover all of them
         overdue_invoices = frappe.get_all(
             "Sales Invoice",
             filters=filters,
             fields=["name", "customer", "due_date", "outstanding_amount"],
-            order_by="due_date asc"
+            order_by="due_date asc",
+            limit=cint(limit) or 50
         )
 
-        if not overdue_invoices:
-            msg = _("No overdue invoices found.")
-            if customer:
-                msg = _("No overdue invoices found for customer ") + f"\"{customer}\"" + _(".")
-            return {"message": msg}
-
-        count = len(overdue_invoices)
-        total_outstanding = sum(inv.outstanding_amount for inv in overdue_invoices)
-
         # Prepare summary
         summary = {
             "count": count,
@@ -125,6 +179,7 @@ def list_overdue_invoices(customer=None):
 # Mapping function names to actual functions
 ERPNext_FUNCTIONS = {
     "check_stock_levels": check_stock_levels,
+    "check_stock_levels_bulk": check_stock_levels_bulk,
     "generate_sales_report": generate_sales_report,
     "list_overdue_invoices": list_overdue_invoices
 }
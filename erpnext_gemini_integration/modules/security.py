@@ -4,10 +4,237 @@
 
 from __future__ import unicode_literals
 import frappe
+import hashlib
 import json
+import re
+from collections import defaultdict
+from dataclasses import dataclass
 from frappe import _
 from frappe.utils import cint
 
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Field types treated as sensitive regardless of customization
+SENSITIVE_FIELD_TYPES = frozenset([
+    "Password", 
+    "Data", 
+    "Small Text", 
+    "Text", 
+    "Long Text", 
+    "Text Editor"
+])
+
+# Prefix of the Redis keys holding the per doctype/user field masks
+SENSITIVE_MASK_CACHE_KEY = "gemini_sensmask"
+
+# Lifetime of a cached field mask, in seconds. Permission changes made
+# without document events, e.g. from the Role Permission Manager, are
+# picked up after at most this long.
+SENSITIVE_MASK_TTL = 5 * 60
+
+# Redis hash holding (enabled, required_role, require_confirmation) per Gemini Function
+FUNCTION_SPEC_CACHE_KEY = "gemini_function_specs"
+
+# Redis key holding the (fingerprint, keywords) of enabled sensitive keywords
+SENSITIVE_KEYWORDS_CACHE_KEY = "gemini_sensitive_keywords"
+
+# Keyword count above which google-re2 is preferred when available
+RE2_KEYWORD_THRESHOLD = 500
+
+# Compiled keyword patterns keyed by keyword set fingerprint
+_keyword_patterns = {}
+
+def clear_sensitive_mask_cache(doc=None, method=None):
+    """
+    Drop cached field masks when permissions or customizations change
+    
+    Args:
+        doc (Document, optional): Document that triggered the event
+        method (str, optional): Name of the event
+    """
+    frappe.cache().delete_keys(f"{SENSITIVE_MASK_CACHE_KEY}|")
+
+def get_field_read_mask(doctype, user=None):
+    """
+    Get read access per field of a DocType for a user
+    
+    Access is resolved from the permission levels the user's roles can read,
+    fetched with a single query. Custom DocPerm rules replace the standard
+    DocPerm rules when a DocType has any, as in Frappe itself.
+    
+    Args:
+        doctype (str): DocType name
+        user (str, optional): The user. Defaults to current user.
+        
+    Returns:
+        dict: Mapping of fieldname to whether the user can read it
+    """
+    roles = tuple(frappe.get_roles(user or frappe.session.user))
+    
+    readable_levels = set()
+    if roles:
+        readable_levels = {cint(row[0]) for row in frappe.db.sql("""
+            SELECT permlevel
+            FROM `tabDocPerm`
+            WHERE parent = %(doctype)s
+            AND role IN %(roles)s
+            AND `read` = 1
+            AND NOT EXISTS (
+                SELECT 1 FROM `tabCustom DocPerm` WHERE parent = %(doctype)s
+            )
+            UNION
+            SELECT permlevel
+            FROM `tabCustom DocPerm`
+            WHERE parent = %(doctype)s
+            AND role IN %(roles)s
+            AND `read` = 1
+        """, {"doctype": doctype, "roles": roles})}
+    
+    return {
+        field.fieldname: cint(field.permlevel) in readable_levels
+        for field in frappe.get_meta(doctype).fields
+    }
+
+def get_function_spec(function_name):
+    """
+    Get the permission and dispatch relevant fields of a Gemini Function
+    
+    Args:
+        function_name (str): Name of the function
+        
+    Returns:
+        tuple: (enabled, required_role, require_confirmation) or None if the function doesn't exist
+    """
+    return frappe.cache().hget(
+        FUNCTION_SPEC_CACHE_KEY,
+        function_name,
+        generator=lambda: frappe.db.get_value(
+            "Gemini Function", function_name, ["enabled", "required_role", "require_confirmation"]
+        )
+    )
+
+def clear_function_spec_cache(function_name=None):
+    """
+    Drop cached Gemini Function specs
+    
+    Args:
+        function_name (str, optional): Function to drop. Defaults to all functions.
+    """
+    if function_name:
+        frappe.cache().hdel(FUNCTION_SPEC_CACHE_KEY, function_name)
+    else:
+        frappe.cache().delete_key(FUNCTION_SPEC_CACHE_KEY)
+
+@dataclass(frozen=True)
+class SanitizedPrompt:
+    """
+    Prompt that has already been through sanitize_prompt
+    
+    Passing this downstream lets audit logging store the prompt without
+    scanning it for sensitive keywords a second time.
+    """
+    raw_hash: str
+    sanitized: str
+    
+    def __str__(self):
+        return self.sanitized
+
+def ensure_sanitized(prompt, user=None):
+    """
+    Get the text of a prompt that is about to be persisted
+    
+    Args:
+        prompt (str or SanitizedPrompt): The prompt
+        user (str, optional): The user. Defaults to current user.
+        
+    Returns:
+        str: Sanitized prompt text
+    """
+    if isinstance(prompt, SanitizedPrompt):
+        return prompt.sanitized
+    
+    # Plain strings are expected to be sanitized already; verify in developer mode.
+    # A missed sanitization is reported and fixed here rather than raised, so the
+    # audit record is still written.
+    if prompt and frappe.conf.developer_mode:
+        sanitized = GeminiSecurity(user).sanitize_prompt(prompt).sanitized
+        if sanitized != prompt:
+            frappe.logger().warning("Unsanitized prompt passed to the Gemini audit log, sanitizing it before storing")
+            return sanitized
+    
+    return prompt
+
+def get_sensitive_keywords():
+    """
+    Get the enabled sensitive keywords, cached in Redis
+    
+    Returns:
+        tuple: (fingerprint, keywords) as stored by build_sensitive_keywords
+    """
+    return frappe.cache().get_value(SENSITIVE_KEYWORDS_CACHE_KEY) or build_sensitive_keywords()
+
+def build_sensitive_keywords():
+    """
+    Load the enabled sensitive keywords and store them in Redis
+    
+    Keywords are sorted longest first so a keyword containing another one
+    is masked as a whole.
+    
+    Returns:
+        tuple: (fingerprint, keywords)
+    """
+    keywords = frappe.get_all(
+        "Gemini Sensitive Keyword",
+        filters={"enabled": 1},
+        pluck="keyword"
+    )
+    
+    keywords = sorted({keyword for keyword in keywords if keyword}, key=lambda k: (-len(k), k))
+    fingerprint = hashlib.md5("\0".join(keywords).encode("utf-8")).hexdigest()
+    
+    frappe.cache().set_value(SENSITIVE_KEYWORDS_CACHE_KEY, (fingerprint, keywords))
+    
+    return fingerprint, keywords
+
+def clear_sensitive_keywords_cache():
+    """Drop the cached sensitive keywords so they are rebuilt on next use"""
+    frappe.cache().delete_value(SENSITIVE_KEYWORDS_CACHE_KEY)
+
+def get_keyword_pattern(fingerprint, keywords):
+    """
+    Get a compiled pattern matching any of the given keywords
+    
+    Patterns are compiled once per keyword set and worker process. Large
+    keyword sets use google-re2 when it is installed.
+    
+    Args:
+        fingerprint (str): Fingerprint of the keyword set
+        keywords (list): Keywords to match, longest first
+        
+    Returns:
+        Pattern: Compiled pattern, or None if there are no keywords
+    """
+    if not keywords:
+        return None
+    
+    pattern = _keyword_patterns.get(fingerprint)
+    
+    if pattern is None:
+        regex = "|".join(map(re.escape, keywords))
+        if re2 and len(keywords) > RE2_KEYWORD_THRESHOLD:
+            pattern = re2.compile(regex)
+        else:
+            pattern = re.compile(regex)
+        
+        # Keyword sets change rarely; keep only the current one
+        _keyword_patterns.clear()
+        _keyword_patterns[fingerprint] = pattern
+    
+    return pattern
+
 class GeminiSecurity:
     """
     Security layer for Gemini Assistant
@@ -27,6 +254,8 @@ class GeminiSecurity:
             user (str, optional): The user. Defaults to current user.
         """
         self.user = user or frappe.session.user
+        self._roles = None
+        self._user_permissions = None
     
     def can_access_gemini(self):
         """
@@ -35,27 +264,31 @@ class GeminiSecurity:
         Returns:
             bool: Whether user has permission
         """
-        # Check if user has the Gemini Assistant User role
-        if frappe.db.exists("Role", "Gemini Assistant User") and frappe.db.get_value("Has Role", {
-            "parent": self.user,
-            "role": "Gemini Assistant User"
-        }):
+        # Check if user has the Gemini Assistant User or System Manager role
+        # in a single round trip; the IN clause already copes with a missing role
+        if frappe.db.sql("""
+            SELECT 1
+            FROM `tabHas Role`
+            WHERE parent = %s
+            AND parenttype = 'User'
+            AND role IN %s
+            LIMIT 1
+        """, (self.user, ("Gemini Assistant User", "System Manager"))):
             return True
         
         # Check if user has permission to read Gemini Assistant Settings
         if frappe.has_permission("Gemini Assistant Settings", "read", user=self.user):
             return True
         
-        # Check if user is System Manager
-        if "System Manager" in frappe.get_roles(self.user):
-            return True
-        
         return False
     
     def filter_sensitive_data(self, doctype, doc_data):
         """
         Mask sensitive fields based on user permissions
         
+        The filtering is done in place on doc_data to avoid rebuilding
+        large documents field by field.
+        
         Args:
             doctype (str): DocType name
             doc_data (dict): Document data
@@ -70,61 +303,89 @@ class GeminiSecurity:
         if frappe.has_permission(doctype, "read", user=self.user) and frappe.has_permission(doctype, "write", user=self.user):
             return doc_data
         
+        # Field visibility is computed once per doctype and user and cached
+        visible_fields, masked_fields = self._get_sensitive_mask(doctype)
+        
+        # Drop fields the user may not see
+        for field in doc_data.keys() - visible_fields:
+            del doc_data[field]
+        
+        # Mask the remaining sensitive fields
+        for field in doc_data.keys() & masked_fields:
+            doc_data[field] = "********"
+        
+        return doc_data
+    
+    def _get_sensitive_mask(self, doctype):
+        """
+        Get the fields of a DocType the user may see and which of them to mask
+        
+        Args:
+            doctype (str): DocType name
+            
+        Returns:
+            tuple: (visible fields, masked fields) as frozensets
+        """
+        key = f"{SENSITIVE_MASK_CACHE_KEY}|{doctype}|{self.user}"
+        mask = frappe.cache().get_value(key)
+        
+        if mask is None:
+            mask = self._build_sensitive_mask(doctype)
+            frappe.cache().set_value(key, mask, expires_in_sec=SENSITIVE_MASK_TTL)
+        
+        return mask
+    
+    def _build_sensitive_mask(self, doctype):
+        """
+        Compute the field visibility and masking for a DocType
+        
+        Args:
+            doctype (str): DocType name
+            
+        Returns:
+            tuple: (visible fields, masked fields) as frozensets
+        """
         # Get meta for the doctype
         meta = frappe.get_meta(doctype)
         
-        # Get sensitive field types
-        sensitive_field_types = [
-            "Password", 
-            "Data", 
-            "Small Text", 
-            "Text", 
-            "Long Text", 
-            "Text Editor"
-        ]
-        
         # Get fields marked as sensitive in customization
-        sensitive_fields = []
-        customizations = frappe.get_all(
+        sensitive_fields = set(frappe.get_all(
             "Property Setter",
             filters={
                 "doc_type": doctype,
                 "property": "gemini_sensitive_field",
                 "value": "1"
             },
-            fields=["field_name"]
-        )
+            pluck="field_name"
+        ))
         
-        for custom in customizations:
-            sensitive_fields.append(custom.field_name)
+        # Resolve read access for every field at once
+        read_mask = get_field_read_mask(doctype, self.user)
         
-        # Filter data
-        filtered_data = {}
-        for field, value in doc_data.items():
-            # Skip if field is not in meta
-            if not meta.get_field(field):
-                continue
+        visible_fields = set()
+        masked_fields = set()
+        for field_meta in meta.fields:
+            field = field_meta.fieldname
+            has_access = read_mask.get(field, True)
             
-            field_meta = meta.get_field(field)
+            # Mask sensitive fields the user doesn't have permission to read
+            if field in sensitive_fields or field_meta.fieldtype in SENSITIVE_FIELD_TYPES:
+                if not has_access:
+                    masked_fields.add(field)
+                visible_fields.add(field)
             
-            # Skip if field is sensitive and user doesn't have permission
-            if field in sensitive_fields or field_meta.fieldtype in sensitive_field_types:
-                if not frappe.has_permission(doctype, "read", field=field, user=self.user):
-                    filtered_data[field] = "********"
-                    continue
-            
-            # Include field if user has permission
-            if frappe.has_permission(doctype, "read", field=field, user=self.user):
-                filtered_data[field] = value
+            # Include other fields only if user has permission
+            elif has_access:
+                visible_fields.add(field)
         
-        return filtered_data
+        return frozenset(visible_fields), frozenset(masked_fields)
     
     def log_interaction(self, prompt, response, actions_taken=None, doctype=None, docname=None):
         """
         Log AI interaction for audit purposes
         
         Args:
-            prompt (str): The prompt sent to Gemini
+            prompt (str or SanitizedPrompt): The sanitized prompt sent to Gemini
             response (dict): The response from Gemini
             actions_taken (dict, optional): Actions taken based on response
             doctype (str, optional): Related DocType
@@ -155,7 +416,7 @@ class GeminiSecurity:
                 audit_log.document = docname
             
             # Set prompt and response
-            audit_log.prompt = prompt
+            audit_log.prompt = ensure_sanitized(prompt, self.user)
             audit_log.response = response.get("text", "") if isinstance(response, dict) else str(response)
             
             # Set actions taken
@@ -175,25 +436,33 @@ class GeminiSecurity:
         Get user permissions for current user
         
         Returns:
-            dict: User permissions
+            dict: Allowed values per DocType as frozensets
         """
         # Get user permission doctypes
-        user_permission_doctypes = frappe.get_all(
-            "User Permission",
-            filters={"user": self.user},
-            fields=["allow", "for_value"],
-            distinct=True
-        )
+        user_permission_doctypes = frappe.db.sql("""
+            SELECT DISTINCT allow, for_value
+            FROM `tabUser Permission`
+            WHERE user = %s
+        """, (self.user,))
         
         # Format permissions
-        permissions = {}
-        for perm in user_permission_doctypes:
-            if perm.allow not in permissions:
-                permissions[perm.allow] = []
-            
-            permissions[perm.allow].append(perm.for_value)
+        permissions = defaultdict(set)
+        for allow, for_value in user_permission_doctypes:
+            permissions[allow].add(for_value)
+        
+        return {allow: frozenset(values) for allow, values in permissions.items()}
+    
+    def get_roles(self):
+        """
+        Get roles of the user, computed once per instance
+        
+        Returns:
+            frozenset: Role names
+        """
+        if self._roles is None:
+            self._roles = frozenset(frappe.get_roles(self.user))
         
-        return permissions
+        return self._roles
     
     def check_function_permission(self, function_name):
         """
@@ -206,15 +475,16 @@ class GeminiSecurity:
             bool: Whether user has permission
         """
         try:
-            # Get function doc
-            function_doc = frappe.get_doc("Gemini Function", function_name)
+            # Get function spec
+            function_spec = get_function_spec(function_name)
             
-            # Check if function is enabled
-            if not function_doc.enabled:
+            # Check if function exists and is enabled
+            if not function_spec or not function_spec[0]:
                 return False
             
             # Check if user has required role
-            if function_doc.required_role and function_doc.required_role not in frappe.get_roles(self.user):
+            required_role = function_spec[1]
+            if required_role and required_role not in self.get_roles():
                 return False
             
             return True
@@ -231,25 +501,48 @@ class GeminiSecurity:
             prompt (str): The prompt to sanitize
             
         Returns:
-            str: Sanitized prompt
+            SanitizedPrompt: Sanitized prompt with the hash of the original
         """
         # This is a basic implementation
         # In a real-world scenario, this would use more sophisticated techniques
         # such as named entity recognition to identify and mask sensitive information
         
+        if isinstance(prompt, SanitizedPrompt):
+            return prompt
+        
+        prompt = prompt or ""
+        raw_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        
+        if not prompt:
+            return SanitizedPrompt(raw_hash, prompt)
+        
         # Get sensitive keywords
-        sensitive_keywords = frappe.get_all(
-            "Gemini Sensitive Keyword",
-            fields=["keyword"]
-        )
+        pattern = get_keyword_pattern(*get_sensitive_keywords())
+        if not pattern:
+            return SanitizedPrompt(raw_hash, prompt)
+        
+        # Replace sensitive keywords in a single pass
+        return SanitizedPrompt(raw_hash, pattern.sub("********", prompt))
+    
+    def has_read_permission(self, doctype):
+        """
+        Check if user can read a DocType, cached for the current request
         
-        sanitized_prompt = prompt
+        Args:
+            doctype (str): DocType name
+            
+        Returns:
+            bool: Whether user has read permission
+        """
+        cache = getattr(frappe.local, "gemini_read_permissions", None)
+        if cache is None:
+            cache = frappe.local.gemini_read_permissions = {}
         
-        # Replace sensitive keywords
-        for keyword in sensitive_keywords:
-            sanitized_prompt = sanitized_prompt.replace(keyword.keyword, "********")
+        key = (self.user, doctype)
+        if key not in cache:
+            cache[key] = bool(frappe.has_permission(doctype, "read", user=self.user))
         
-        return sanitized_prompt
+        return cache[key]
     
     def validate_data_access(self, doctype, filters=None):
         """
@@ -264,15 +557,20 @@ class GeminiSecurity:
         """
         try:
             # Check if user has read permission for doctype
-            if not frappe.has_permission(doctype, "read", user=self.user):
+            if not self.has_read_permission(doctype):
                 return False
             
             # If no filters, user has general access
             if not filters:
                 return True
             
-            # Get user permissions
-            user_permissions = self.get_user_permissions()
+            # Get user permissions, fetched once per instance
+            if self._user_permissions is None:
+                self._user_permissions = self.get_user_permissions()
+            
+            user_permissions = self._user_permissions
+            if not user_permissions:
+                return True
             
             # Check if filters match user permissions
             for field, value in filters.items():
@@ -4,10 +4,37 @@
 
 from __future__ import unicode_literals
 import frappe
-import json
+import time
 from frappe import _
 from frappe.utils import now_datetime, add_days, add_months
 from datetime import datetime, timedelta
+from erpnext_gemini_integration.utils import json_utils
+
+# Hourly counts stop at this many rows; larger counts are reported as approximate
+HOURLY_COUNT_CAP = 1000
+
+# Time budget for the hourly metrics query, in seconds
+HOURLY_QUERY_TIME_BUDGET = 1
+
+# Redis sorted set of active users scored by their last activity time
+ACTIVE_USERS_KEY = "gemini:active_users"
+
+# Sliding window over which users count as active, in seconds
+ACTIVE_USERS_WINDOW = 60 * 60
+
+# Columns written when workflow logs are inserted by _insert_log
+WORKFLOW_LOG_INSERT_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "user", "timestamp", "workflow_type", "status", "results", "error"
+]
+
+# Lifetime of the run locks, slightly shorter than the scheduler interval
+HOURLY_LOCK_TTL = 3500
+DAILY_LOCK_TTL = 86000
+
+# Lifetime of the results served to duplicate runs, in seconds
+HOURLY_RESULT_TTL = 2 * 60 * 60
+DAILY_RESULT_TTL = 2 * 24 * 60 * 60
 
 class GeminiWorkflow:
     """
@@ -42,33 +69,274 @@ class GeminiWorkflow:
             str: ID of the log entry
         """
         try:
-            # Create workflow log
-            workflow_log = frappe.new_doc("Gemini Workflow Log")
-            workflow_log.user = self.user
-            workflow_log.timestamp = now_datetime()
-            workflow_log.workflow_type = workflow_type
-            workflow_log.status = status
+            name = frappe.generate_hash(length=10)
             
-            # Set results or error
-            if results:
-                workflow_log.results = json.dumps(results)
-                
-            if error:
-                workflow_log.error = error
-                
-            workflow_log.insert(ignore_permissions=True)
+            # Insert the log on a background worker, it is audit data only
+            frappe.enqueue(
+                "erpnext_gemini_integration.modules.workflow._insert_log",
+                queue="short",
+                name=name,
+                user=self.user,
+                timestamp=now_datetime(),
+                workflow_type=workflow_type,
+                status=status,
+                results_json=json_utils.dumps(results) if results else None,
+                error=error,
+                enqueue_after_commit=True
+            )
             
-            return workflow_log.name
+            return name
             
         except Exception as e:
             frappe.log_error(f"Error logging workflow execution: {str(e)}")
             return None
 
+def _insert_log(name, user, timestamp, workflow_type, status, results_json=None, error=None):
+    """
+    Write a workflow log row with a single INSERT, bypassing document hooks
+    
+    Args:
+        name (str): Name of the log entry
+        user (str): User the workflow ran as
+        timestamp (datetime): Time of execution
+        workflow_type (str): Type of workflow (hourly, daily, etc.)
+        status (str): Status of execution (success, failed)
+        results_json (str, optional): Serialized results of workflow execution
+        error (str, optional): Error message if workflow failed
+    """
+    try:
+        now = now_datetime()
+        frappe.db.bulk_insert(
+            "Gemini Workflow Log",
+            WORKFLOW_LOG_INSERT_FIELDS,
+            [(name, now, now, user, user, 0, user, timestamp, workflow_type, status, results_json, error)]
+        )
+        
+    except Exception as e:
+        frappe.log_error(f"Error logging workflow execution: {str(e)}")
+
+def _get_cached_metrics(key, generator, expires_in_sec):
+    """
+    Get analysis metrics from cache, computing them on a miss
+    
+    Only used for closed time buckets, whose metrics don't change, so
+    re-runs within the bucket are served from Redis instead of scanning
+    the tables again.
+    
+    Args:
+        key (str): Cache key identifying the workflow and time bucket
+        generator (callable): Function computing the metrics
+        expires_in_sec (int): Lifetime of the cached metrics
+        
+    Returns:
+        dict: Metrics
+    """
+    metrics = frappe.cache().get_value(key)
+    
+    if metrics is None:
+        metrics = generator()
+        frappe.cache().set_value(key, metrics, expires_in_sec=expires_in_sec)
+    
+    return metrics
+
+def _get_hourly_metrics(since):
+    """
+    Collect all hourly metrics in a single round trip
+    
+    Each count stops at HOURLY_COUNT_CAP and the query is given a time
+    budget of HOURLY_QUERY_TIME_BUDGET seconds so a missing index can't
+    stall the scheduler. Counts over the cap are reported as
+    ">HOURLY_COUNT_CAP" with "approx" set. If the budget runs out no SQL
+    counts are reported and "timed_out" is set as well.
+    
+    Args:
+        since (datetime): Start of the analysed period
+        
+    Returns:
+        dict: Transaction, error and active user counts
+    """
+    # Active users come from the Redis sorted set unless the SQL count is requested
+    active_users_from_sql = frappe.conf.get("gemini_active_users_from_sql")
+    
+    query = """
+        SELECT
+            (SELECT COUNT(*) FROM (SELECT 1 FROM `tabSales Invoice` WHERE creation >= %(since)s LIMIT %(limit)s) t) AS sales_count,
+            (SELECT COUNT(*) FROM (SELECT 1 FROM `tabPurchase Invoice` WHERE creation >= %(since)s LIMIT %(limit)s) t) AS purchase_count,
+            (SELECT COUNT(*) FROM (SELECT 1 FROM `tabStock Entry` WHERE creation >= %(since)s LIMIT %(limit)s) t) AS stock_count,
+            (SELECT COUNT(*) FROM (SELECT 1 FROM `tabError Log` WHERE creation >= %(since)s LIMIT %(limit)s) t) AS error_count
+    """
+    
+    if active_users_from_sql:
+        query += """,
+            (SELECT COUNT(*) FROM (SELECT DISTINCT user FROM `tabActivity Log` WHERE creation >= %(since)s LIMIT %(limit)s) t) AS active_users
+        """
+    
+    if frappe.db.db_type == "mariadb":
+        query = f"SET STATEMENT max_statement_time={HOURLY_QUERY_TIME_BUDGET} FOR {query}"
+    
+    try:
+        counts = frappe.db.sql(query, {"since": since, "limit": HOURLY_COUNT_CAP + 1}, as_dict=True)[0]
+    except Exception as e:
+        if not frappe.db.is_statement_timeout(e):
+            raise
+        
+        frappe.logger().warning("Hourly Gemini analysis metrics exceeded the query time budget")
+        metrics = {"approx": True, "timed_out": True}
+        
+        if not active_users_from_sql:
+            metrics["active_users"] = _count_active_users()
+        
+        return metrics
+    
+    if not active_users_from_sql:
+        counts["active_users"] = _count_active_users()
+    
+    metrics = {}
+    for key, value in counts.items():
+        if value > HOURLY_COUNT_CAP:
+            metrics[key] = f">{HOURLY_COUNT_CAP}"
+            metrics["approx"] = True
+        else:
+            metrics[key] = value
+    
+    return metrics
+
+def _count_active_users():
+    """
+    Get the number of distinct users active within the sliding window
+    
+    Users older than ACTIVE_USERS_WINDOW are dropped from the sorted set
+    first, so the count is a single ZCARD.
+    
+    Returns:
+        int: Distinct active users
+    """
+    cache = frappe.cache()
+    key = cache.make_key(ACTIVE_USERS_KEY)
+    
+    pipeline = cache.pipeline()
+    pipeline.zremrangebyscore(key, "-inf", time.time() - ACTIVE_USERS_WINDOW)
+    pipeline.zcard(key)
+    
+    return pipeline.execute()[-1]
+
+def track_active_user(doc, method=None):
+    """
+    Record the user of a new Activity Log in the active user sorted set
+    
+    Args:
+        doc (Document): The Activity Log
+        method (str, optional): Name of the event
+    """
+    try:
+        if not doc.user:
+            return
+        
+        cache = frappe.cache()
+        key = cache.make_key(ACTIVE_USERS_KEY)
+        
+        pipeline = cache.pipeline()
+        pipeline.zadd(key, {doc.user: time.time()})
+        pipeline.expire(key, ACTIVE_USERS_WINDOW)
+        pipeline.execute()
+        
+    except Exception as e:
+        # Activity tracking must never block the Activity Log insert
+        frappe.logger().warning(f"Error tracking active user for Gemini analysis: {str(e)}")
+
+def _count_exceeds(value, threshold):
+    """
+    Compare a possibly capped count against a threshold
+    
+    Args:
+        value (int or str): Count, or ">HOURLY_COUNT_CAP" when capped
+        threshold (int): Threshold to compare against
+        
+    Returns:
+        bool: Whether the count is above the threshold
+    """
+    if isinstance(value, str):
+        return HOURLY_COUNT_CAP >= threshold
+    
+    return (value or 0) > threshold
+
+def _get_daily_metrics(today, yesterday, last_week):
+    """
+    Collect sales, inventory and receivables metrics in a single round trip
+    
+    Args:
+        today (date): Current date
+        yesterday (date): Day being analysed
+        last_week (date): Start of the trailing week used for averages
+        
+    Returns:
+        dict: Sales, low stock and overdue invoice metrics
+    """
+    # Use the indexed flag from the add_bin_below_reorder_flag patch when present
+    if frappe.db.has_column("Bin", "below_reorder"):
+        low_stock_condition = "below_reorder = 1"
+    else:
+        low_stock_condition = "actual_qty <= reorder_level AND reorder_level > 0"
+    
+    return frappe.db.sql(f"""
+        SELECT
+            sales.yesterday_sales,
+            sales.last_week_sales,
+            (
+                SELECT COUNT(*)
+                FROM `tabBin`
+                WHERE {low_stock_condition}
+            ) AS low_stock_items,
+            overdue.overdue_count,
+            overdue.overdue_amount
+        FROM
+            (
+                SELECT
+                    COALESCE(SUM(CASE WHEN posting_date = %(yesterday)s THEN grand_total END), 0) AS yesterday_sales,
+                    COALESCE(SUM(grand_total), 0) AS last_week_sales
+                FROM `tabSales Invoice`
+                WHERE posting_date BETWEEN %(last_week)s AND %(yesterday)s
+                AND docstatus = 1
+            ) sales,
+            (
+                SELECT
+                    COUNT(*) AS overdue_count,
+                    COALESCE(SUM(outstanding_amount), 0) AS overdue_amount
+                FROM `tabSales Invoice`
+                WHERE docstatus = 1
+                AND due_date < %(today)s
+                AND outstanding_amount > 0
+            ) overdue
+    """, {"today": today, "yesterday": yesterday, "last_week": last_week}, as_dict=True)[0]
+
+def _acquire_run_lock(key, expires_in_sec):
+    """
+    Take a site wide lock so a workflow runs once per time bucket
+    
+    Args:
+        key (str): Lock key identifying the workflow and time bucket
+        expires_in_sec (int): Lifetime of the lock
+        
+    Returns:
+        bool: Whether the lock was acquired
+    """
+    cache = frappe.cache()
+    return bool(cache.set(cache.make_key(key), 1, ex=expires_in_sec, nx=True))
+
+def _release_run_lock(key):
+    """
+    Release a workflow run lock so a failed run can be retried in the same bucket
+    
+    Args:
+        key (str): Lock key identifying the workflow and time bucket
+    """
+    frappe.cache().delete_value(key)
+
 def run_hourly_analysis():
     """
     Run hourly analysis of business data
     
-    This function is called by a scheduled job every hour to analyze:
+    This function is called by a scheduled job on the long queue every hour to analyze:
     - Recent transactions
     - System performance
     - User activity
@@ -76,78 +344,69 @@ def run_hourly_analysis():
     Returns:
         dict: Results of analysis
     """
+    ts = now_datetime()
+    bucket = ts.strftime("%Y%m%d%H")
+    
+    lock_key = f"gemini:hourly:done:{bucket}"
+    
+    # Serve duplicate runs within the same hour from the first run's results
+    if not _acquire_run_lock(lock_key, HOURLY_LOCK_TTL):
+        frappe.logger().info("Hourly Gemini analysis already ran this hour, skipping")
+        return frappe.cache().get_value(f"gemini:hourly:result:{bucket}") or {}
+    
     try:
         workflow = GeminiWorkflow(user="Administrator")
         frappe.logger().info("Starting hourly Gemini analysis")
         
         # Initialize results
         results = {
-            "timestamp": str(now_datetime()),
+            "timestamp": str(ts),
             "metrics": {},
             "insights": [],
             "actions": []
         }
         
-        # Analyze recent transactions
+        # Get transactions from last hour
+        last_hour = ts.replace(minute=0, second=0, microsecond=0)
+        
+        # Collect hourly metrics
+        metrics_failed = False
         try:
-            # Get transactions from last hour
-            last_hour = add_days(now_datetime(), 0)
-            last_hour = last_hour.replace(minute=0, second=0, microsecond=0)
-            
-            # Sales transactions
-            sales_count = frappe.db.count("Sales Invoice", {"creation": [">=", last_hour]})
-            results["metrics"]["sales_count"] = sales_count
-            
-            # Purchase transactions
-            purchase_count = frappe.db.count("Purchase Invoice", {"creation": [">=", last_hour]})
-            results["metrics"]["purchase_count"] = purchase_count
+            # The current hour is still open, so its counts aren't cached
+            metrics = _get_hourly_metrics(last_hour)
             
-            # Stock transactions
-            stock_count = frappe.db.count("Stock Entry", {"creation": [">=", last_hour]})
-            results["metrics"]["stock_count"] = stock_count
+            results["metrics"].update(metrics)
             
-            # Add insight if transaction volume is unusual
-            if sales_count > 100:
-                results["insights"].append("Unusually high sales volume detected in the last hour")
-                
         except Exception as e:
-            frappe.log_error(f"Error analyzing transactions in hourly analysis: {str(e)}")
-            results["insights"].append("Error analyzing transactions")
+            frappe.log_error(f"Error collecting metrics in hourly analysis: {str(e)}")
+            results["insights"].append("Error collecting hourly metrics")
+            metrics = {}
+            metrics_failed = True
         
-        # Analyze system performance
-        try:
-            # Get error logs from last hour
-            error_count = frappe.db.count("Error Log", {"creation": [">=", last_hour]})
-            results["metrics"]["error_count"] = error_count
+        if metrics.get("timed_out"):
+            # Counts are unknown, skip the count based insights
+            results["insights"].append("Hourly metrics query timed out, volume checks skipped")
+        
+        else:
+            # Add insight if transaction volume is unusual
+            if _count_exceeds(metrics.get("sales_count"), 100):
+                results["insights"].append("Unusually high sales volume detected in the last hour")
             
             # Add insight if error count is high
-            if error_count > 10:
+            if _count_exceeds(metrics.get("error_count"), 10):
                 results["insights"].append("Unusually high number of system errors detected")
                 results["actions"].append("Investigate system errors in the Error Log")
-                
-        except Exception as e:
-            frappe.log_error(f"Error analyzing system performance in hourly analysis: {str(e)}")
-            results["insights"].append("Error analyzing system performance")
-        
-        # Analyze user activity
-        try:
-            # Get active users in last hour
-            active_users = frappe.db.sql("""
-                SELECT COUNT(DISTINCT user) 
-                FROM `tabActivity Log` 
-                WHERE creation >= %s
-            """, last_hour)[0][0]
-            
-            results["metrics"]["active_users"] = active_users
-            
-        except Exception as e:
-            frappe.log_error(f"Error analyzing user activity in hourly analysis: {str(e)}")
-            results["insights"].append("Error analyzing user activity")
         
         # Log successful execution
         workflow.log_workflow_execution("hourly", "success", results)
         
-        frappe.logger().info(f"Completed hourly Gemini analysis: {json.dumps(results)}")
+        if metrics_failed:
+            # Let a retry in this bucket collect the metrics again
+            _release_run_lock(lock_key)
+        else:
+            frappe.cache().set_value(f"gemini:hourly:result:{bucket}", results, expires_in_sec=HOURLY_RESULT_TTL)
+        
+        frappe.logger().info(f"Completed hourly Gemini analysis: {json_utils.dumps(results)}")
         return results
         
     except Exception as e:
@@ -157,6 +416,8 @@ def run_hourly_analysis():
         
         if 'workflow' in locals():
             workflow.log_workflow_execution("hourly", "failed", error=error_message)
+        
+        _release_run_lock(lock_key)
             
         return {"error": error_message}
 
@@ -164,7 +425,7 @@ def run_daily_analysis():
     """
     Run daily analysis of business data
     
-    This function is called by a scheduled job every day to analyze:
+    This function is called by a scheduled job on the long queue every day to analyze:
     - Daily business performance
     - Trends and patterns
     - Key metrics for decision making
@@ -172,13 +433,23 @@ def run_daily_analysis():
     Returns:
         dict: Results of analysis
     """
+    ts = now_datetime()
+    bucket = ts.strftime("%Y%m%d")
+    
+    lock_key = f"gemini:daily:done:{bucket}"
+    
+    # Serve duplicate runs within the same day from the first run's results
+    if not _acquire_run_lock(lock_key, DAILY_LOCK_TTL):
+        frappe.logger().info("Daily Gemini analysis already ran today, skipping")
+        return frappe.cache().get_value(f"gemini:daily:result:{bucket}") or {}
+    
     try:
         workflow = GeminiWorkflow(user="Administrator")
         frappe.logger().info("Starting daily Gemini analysis")
         
         # Initialize results
         results = {
-            "timestamp": str(now_datetime()),
+            "timestamp": str(ts),
             "metrics": {},
             "insights": [],
             "actions": [],
@@ -186,27 +457,30 @@ def run_daily_analysis():
         }
         
         # Get date range
-        today = now_datetime().date()
+        today = ts.date()
         yesterday = add_days(today, -1)
         last_week = add_days(today, -7)
         last_month = add_months(today, -1)
         
-        # Analyze daily sales
+        # Collect daily metrics
+        metrics_failed = False
         try:
-            # Get sales data
-            yesterday_sales = frappe.db.sql("""
-                SELECT SUM(grand_total) 
-                FROM `tabSales Invoice` 
-                WHERE DATE(posting_date) = %s
-                AND docstatus = 1
-            """, yesterday)[0][0] or 0
+            metrics = _get_cached_metrics(
+                f"gemini:daily:{yesterday.isoformat()}",
+                lambda: _get_daily_metrics(today, yesterday, last_week),
+                expires_in_sec=86400
+            )
             
-            last_week_sales = frappe.db.sql("""
-                SELECT SUM(grand_total) 
-                FROM `tabSales Invoice` 
-                WHERE posting_date BETWEEN %s AND %s
-                AND docstatus = 1
-            """, [last_week, yesterday])[0][0] or 0
+        except Exception as e:
+            frappe.log_error(f"Error collecting metrics in daily analysis: {str(e)}")
+            results["insights"].append("Error collecting daily metrics")
+            metrics = None
+            metrics_failed = True
+        
+        if metrics:
+            # Analyze daily sales
+            yesterday_sales = metrics.yesterday_sales
+            last_week_sales = metrics.last_week_sales
             
             # Calculate averages
             avg_daily_sales = last_week_sales / 7 if last_week_sales else 0
@@ -225,44 +499,18 @@ def run_daily_analysis():
             elif sales_trend < -20:
                 results["insights"].append(f"Sales decreased by {abs(sales_trend):.1f}% compared to daily average")
                 results["actions"].append("Review sales performance and identify potential issues")
-                
-        except Exception as e:
-            frappe.log_error(f"Error analyzing daily sales in daily analysis: {str(e)}")
-            results["insights"].append("Error analyzing daily sales")
-        
-        # Analyze inventory levels
-        try:
-            # Get low stock items
-            low_stock_items = frappe.db.sql("""
-                SELECT COUNT(*) 
-                FROM `tabBin` 
-                WHERE actual_qty <= reorder_level 
-                AND reorder_level > 0
-            """)[0][0] or 0
             
+            # Analyze inventory levels
+            low_stock_items = metrics.low_stock_items
             results["metrics"]["low_stock_items"] = low_stock_items
             
             if low_stock_items > 0:
                 results["insights"].append(f"{low_stock_items} items are below reorder level")
                 results["actions"].append("Review stock levels and create purchase orders")
-                
-        except Exception as e:
-            frappe.log_error(f"Error analyzing inventory in daily analysis: {str(e)}")
-            results["insights"].append("Error analyzing inventory levels")
-        
-        # Analyze accounts receivable
-        try:
-            # Get overdue invoices
-            overdue_invoices = frappe.db.sql("""
-                SELECT COUNT(*), SUM(outstanding_amount) 
-                FROM `tabSales Invoice` 
-                WHERE docstatus = 1 
-                AND due_date < %s 
-                AND outstanding_amount > 0
-            """, today, as_dict=True)[0]
             
-            overdue_count = overdue_invoices.get("COUNT(*)", 0)
-            overdue_amount = overdue_invoices.get("SUM(outstanding_amount)", 0)
+            # Analyze accounts receivable
+            overdue_count = metrics.overdue_count
+            overdue_amount = metrics.overdue_amount
             
             results["metrics"]["overdue_invoices"] = overdue_count
             results["metrics"]["overdue_amount"] = overdue_amount
@@ -270,15 +518,17 @@ def run_daily_analysis():
             if overdue_count > 10 or overdue_amount > 10000:
                 results["insights"].append(f"{overdue_count} overdue invoices with total amount {overdue_amount}")
                 results["actions"].append("Follow up on overdue payments")
-                
-        except Exception as e:
-            frappe.log_error(f"Error analyzing accounts receivable in daily analysis: {str(e)}")
-            results["insights"].append("Error analyzing accounts receivable")
         
         # Log successful execution
         workflow.log_workflow_execution("daily", "success", results)
         
-        frappe.logger().info(f"Completed daily Gemini analysis: {json.dumps(results)}")
+        if metrics_failed:
+            # Let a retry in this bucket collect the metrics again
+            _release_run_lock(lock_key)
+        else:
+            frappe.cache().set_value(f"gemini:daily:result:{bucket}", results, expires_in_sec=DAILY_RESULT_TTL)
+        
+        frappe.logger().info(f"Completed daily Gemini analysis: {json_utils.dumps(results)}")
         return results
         
     except Exception as e:
@@ -288,5 +538,7 @@ def run_daily_analysis():
         
         if 'workflow' in locals():
             workflow.log_workflow_execution("daily", "failed", error=error_message)
+        
+        _release_run_lock(lock_key)
             
         return {"error": error_message}
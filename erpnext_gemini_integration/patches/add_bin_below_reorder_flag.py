@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, Golive-Solutions and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+def execute():
+    """
+    Add an indexed below_reorder flag to Bin for the daily low stock count
+
+    actual_qty <= reorder_level compares two columns, so no index can serve
+    it and the daily analysis scans every Bin row. A stored generated column
+    keeps the comparison precomputed by the database on every write, and its
+    index turns the count into a single index range read.
+    """
+    if frappe.db.db_type != "mariadb" or not frappe.db.table_exists("Bin"):
+        return
+
+    if not frappe.db.has_column("Bin", "reorder_level") or frappe.db.has_column("Bin", "below_reorder"):
+        return
+
+    frappe.db.sql_ddl("""
+        ALTER TABLE `tabBin`
+        ADD COLUMN below_reorder TINYINT AS (actual_qty <= reorder_level AND reorder_level > 0) STORED,
+        ADD KEY idx_below_reorder (below_reorder)
+    """)
+
+    frappe.db.clear_table_cache()
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, Golive-Solutions and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+def execute():
+    """
+    Index Sales Invoice on (docstatus, status, due_date)
+
+    list_overdue_invoices filters on all three columns on every chat turn
+    that asks about receivables; the composite index turns it into a range
+    scan over due_date.
+    """
+    if not frappe.db.table_exists("Sales Invoice"):
+        return
+
+    frappe.db.add_index("Sales Invoice", ["docstatus", "status", "due_date"], "idx_overdue")
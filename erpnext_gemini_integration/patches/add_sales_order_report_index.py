@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, Golive-Solutions and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+def execute():
+    """
+    Index Sales Order on (docstatus, transaction_date)
+
+    generate_sales_report aggregates submitted orders over a date range,
+    which becomes an index range scan instead of a full table scan.
+    """
+    if not frappe.db.table_exists("Sales Order"):
+        return
+
+    frappe.db.add_index("Sales Order", ["docstatus", "transaction_date"])
@@ -4,6 +4,7 @@
 
 from __future__ import unicode_literals
 import frappe
+from frappe.utils import cint
 
 def boot_session(bootinfo):
     """
@@ -13,10 +14,13 @@ def boot_session(bootinfo):
         bootinfo: Boot info object passed by Frappe
     """
     # Check if Gemini Assistant is enabled globally
-    gemini_enabled = frappe.db.get_global("gemini_assistant_enabled")
+    gemini_enabled = frappe.cache().get_value(
+        "gemini_assistant_enabled",
+        generator=lambda: cint(frappe.db.get_global("gemini_assistant_enabled"))
+    )
     
     # Add to boot info
-    bootinfo.gemini_assistant_enabled = int(gemini_enabled or 0)
+    bootinfo.gemini_assistant_enabled = cint(gemini_enabled)
     
     # Check if user has permission to use Gemini Assistant
     if has_gemini_permission():
@@ -30,28 +34,33 @@ def has_gemini_permission():
     """
     Check if user has permission to use Gemini Assistant
     
+    Returns:
+        bool: Whether user has permission
+    """
+    # Computed once per request
+    cached = frappe.local.flags.get("gemini_permission")
+    if cached is None or cached[0] != frappe.session.user:
+        cached = frappe.local.flags.gemini_permission = (frappe.session.user, _has_gemini_permission())
+    
+    return cached[1]
+
+def _has_gemini_permission():
+    """
+    Check if user has permission to use Gemini Assistant, without caching
+    
     Returns:
         bool: Whether user has permission
     """
     if frappe.session.user == "Administrator":
         return True
         
-    # Check if user has the Gemini Assistant User role
-    if frappe.db.exists("Role", "Gemini Assistant User") and frappe.db.get_value("Has Role", {
-        "parent": frappe.session.user,
-        "role": "Gemini Assistant User"
-    }):
+    # Roles are cached per user, so check them before the permission lookup
+    roles = set(frappe.get_roles())
+    if "System Manager" in roles or "Gemini Assistant User" in roles:
         return True
     
     # Check if user has permission to read Gemini Assistant Settings
-    if frappe.has_permission("Gemini Assistant Settings", "read"):
-        return True
-    
-    # Check if user is System Manager
-    if "System Manager" in frappe.get_roles():
-        return True
-    
-    return False
+    return bool(frappe.has_permission("Gemini Assistant Settings", "read"))
 
 def add_gemini_settings(bootinfo):
     """
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, Golive-Solutions and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import base64
+import binascii
+import zlib
+
+# Marker for text stored compressed
+COMPRESSED_PREFIX = "zlib:"
+
+# Bodies shorter than this are stored as is
+MIN_COMPRESS_LENGTH = 256
+
+def compress_text(text):
+    """
+    Compress a large text body for storage in a text column
+    
+    Args:
+        text (str): Text to compress
+        
+    Returns:
+        str: Compressed text with marker, or the text unchanged if it is
+            short, already compressed or doesn't shrink
+    """
+    if not text or len(text) < MIN_COMPRESS_LENGTH or is_compressed(text):
+        return text
+    
+    compressed = COMPRESSED_PREFIX + base64.b64encode(zlib.compress(text.encode("utf-8"), 6)).decode("ascii")
+    
+    return compressed if len(compressed) < len(text) else text
+
+def decompress_text(text):
+    """
+    Restore text stored by compress_text
+    
+    Args:
+        text (str): Stored text
+        
+    Returns:
+        str: Original text; values that aren't compressed are returned as is
+    """
+    if not is_compressed(text):
+        return text
+    
+    try:
+        return zlib.decompress(base64.b64decode(text[len(COMPRESSED_PREFIX):], validate=True)).decode("utf-8")
+    except (binascii.Error, zlib.error, UnicodeDecodeError):
+        # Plain text that happens to start with the marker
+        return text
+
+def is_compressed(text):
+    """
+    Check if text was stored by compress_text
+    
+    Args:
+        text (str): Stored text
+        
+    Returns:
+        bool: Whether text carries the compression marker
+    """
+    return isinstance(text, str) and text.startswith(COMPRESSED_PREFIX)
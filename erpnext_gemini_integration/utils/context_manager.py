@@ -4,8 +4,55 @@
 
 from __future__ import unicode_literals
 import frappe
-import json
 from frappe import _
+from frappe.utils import cint, now_datetime
+from datetime import timedelta
+from erpnext_gemini_integration.utils import json_utils
+
+# Columns written when messages are bulk inserted by update_conversation
+MESSAGE_INSERT_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "conversation", "timestamp", "role", "content", "actions_taken"
+]
+
+# Field types searched by get_relevant_documents
+SEARCHABLE_FIELD_TYPES = frozenset([
+    "Data", "Text", "Small Text", "Long Text",
+    "Text Editor", "Code", "Link", "Select"
+])
+
+# Redis hash holding the searchable fields per doctype
+SEARCHABLE_FIELDS_CACHE_KEY = "gemini_searchable_fields"
+
+def get_searchable_fields(doctype):
+    """
+    Get the fields of a DocType searched for relevant documents
+    
+    Args:
+        doctype (str): DocType name
+        
+    Returns:
+        tuple: Fieldnames, starting with name
+    """
+    return frappe.cache().hget(
+        SEARCHABLE_FIELDS_CACHE_KEY,
+        doctype,
+        generator=lambda: ("name",) + tuple(
+            field.fieldname
+            for field in frappe.get_meta(doctype).fields
+            if field.fieldtype in SEARCHABLE_FIELD_TYPES and not field.is_virtual
+        )
+    )
+
+def clear_searchable_fields_cache(doc=None, method=None):
+    """
+    Drop cached searchable fields when a DocType or its customizations change
+    
+    Args:
+        doc (Document, optional): Document that triggered the event
+        method (str, optional): Name of the event
+    """
+    frappe.cache().delete_key(SEARCHABLE_FIELDS_CACHE_KEY)
 
 class GeminiContextManager:
     """
@@ -39,31 +86,21 @@ class GeminiContextManager:
             list: List of messages in the conversation
         """
         try:
-            # Get conversation by session_id
-            conversation = frappe.get_all(
-                "Gemini Conversation",
-                filters={"session_id": session_id, "user": self.user},
-                fields=["name"]
-            )
-            
-            if not conversation:
-                return []
-            
-            conversation_id = conversation[0].name
-            
-            # Get messages
-            messages = frappe.get_all(
-                "Gemini Message",
-                filters={"conversation": conversation_id},
-                fields=["timestamp", "role", "content", "actions_taken"],
-                order_by="timestamp asc",
-                limit=max_messages
-            )
+            # Get messages of the session's conversation in one query
+            messages = frappe.db.sql("""
+                SELECT m.timestamp, m.role, m.content, m.actions_taken
+                FROM `tabGemini Message` m
+                JOIN `tabGemini Conversation` c ON m.conversation = c.name
+                WHERE c.session_id = %s
+                AND c.user = %s
+                ORDER BY m.timestamp ASC
+                LIMIT %s
+            """, (session_id, self.user, cint(max_messages)), as_dict=True)
             
             # Process messages
             for msg in messages:
                 if msg.actions_taken:
-                    msg.actions_taken = json.loads(msg.actions_taken)
+                    msg.actions_taken = json_utils.loads(msg.actions_taken)
             
             return messages
             
@@ -95,9 +132,8 @@ class GeminiContextManager:
             if page_info.get("doctype"):
                 context["doctype"] = page_info.get("doctype")
                 
-                # Get module for doctype
-                meta = frappe.get_meta(context["doctype"])
-                context["module"] = meta.module
+                # Get module for doctype without loading its meta
+                context["module"] = frappe.db.get_value("DocType", context["doctype"], "module", cache=True)
             
             if page_info.get("docname"):
                 context["docname"] = page_info.get("docname")
@@ -136,31 +172,31 @@ class GeminiContextManager:
                 doctype = context.get("doctype")
                 
                 # Get searchable fields for the doctype
-                meta = frappe.get_meta(doctype)
-                search_fields = ["name"]
+                search_fields = get_searchable_fields(doctype)
                 
-                for field in meta.fields:
-                    if field.fieldtype in ["Data", "Text", "Small Text", "Long Text", 
-                                          "Text Editor", "Code", "Link", "Select"]:
-                        search_fields.append(field.fieldname)
+                # Search all fields with a single query
+                columns = ", ".join(f"`{field}`" for field in search_fields)
+                conditions = " OR ".join(f"`{field}` LIKE %s" for field in search_fields)
+                docs = frappe.db.sql(
+                    f"SELECT {columns} FROM `tab{doctype}` WHERE {conditions} LIMIT 10",
+                    [f"%{query}%"] * len(search_fields),
+                    as_dict=True
+                )
                 
-                # Search for documents
-                for field in search_fields:
-                    docs = frappe.get_all(
-                        doctype,
-                        filters={field: ["like", f"%{query}%"]},
-                        fields=["name", field],
-                        limit=5
+                # Rows come from one query on the primary table, so names are unique
+                needle = query.lower()
+                for doc in docs:
+                    # Report the first field that matched
+                    field = next(
+                        (f for f in search_fields if needle in str(doc.get(f) or "").lower()),
+                        "name"
                     )
-                    
-                    for doc in docs:
-                        if doc.name not in [r.get("name") for r in results]:
-                            results.append({
-                                "doctype": doctype,
-                                "name": doc.name,
-                                "field": field,
-                                "value": doc.get(field)
-                            })
+                    results.append({
+                        "doctype": doctype,
+                        "name": doc.name,
+                        "field": field,
+                        "value": doc.get(field)
+                    })
             
             # If no results or no specific doctype, search globally
             if not results:
@@ -193,51 +229,51 @@ class GeminiContextManager:
             str: Conversation ID
         """
         try:
+            now = now_datetime()
+            
+            # The reply sorts after its prompt in timestamp ordered queries
+            reply_time = now + timedelta(microseconds=1)
+            
             # Get or create conversation
-            conversation = frappe.get_all(
+            conversation_id = frappe.db.get_value(
                 "Gemini Conversation",
-                filters={"session_id": session_id, "user": self.user},
-                fields=["name"]
+                {"session_id": session_id, "user": self.user},
+                "name"
             )
             
-            if conversation:
-                conversation_id = conversation[0].name
-                conversation_doc = frappe.get_doc("Gemini Conversation", conversation_id)
-            else:
+            is_new = not conversation_id
+            if is_new:
                 conversation_doc = frappe.new_doc("Gemini Conversation")
                 conversation_doc.user = self.user
                 conversation_doc.session_id = session_id
-                conversation_doc.start_time = frappe.utils.now()
+                conversation_doc.start_time = now
+                conversation_doc.end_time = reply_time
                 conversation_doc.active = 1
                 conversation_doc.insert()
                 conversation_id = conversation_doc.name
             
-            # Create user message
-            user_message = frappe.new_doc("Gemini Message")
-            user_message.conversation = conversation_id
-            user_message.timestamp = frappe.utils.now()
-            user_message.role = "user"
-            user_message.content = message
-            user_message.insert()
-            
-            # Create assistant message
-            assistant_message = frappe.new_doc("Gemini Message")
-            assistant_message.conversation = conversation_id
-            assistant_message.timestamp = frappe.utils.now()
-            assistant_message.role = "assistant"
-            assistant_message.content = response.get("text", "")
-            
             # Add function call if present
+            actions_taken = None
             if response.get("function_call"):
-                assistant_message.actions_taken = json.dumps({
+                actions_taken = json_utils.dumps({
                     "function_call": response.get("function_call")
                 })
             
-            assistant_message.insert()
+            # Insert user and assistant messages in one statement
+            frappe.db.bulk_insert(
+                "Gemini Message",
+                MESSAGE_INSERT_FIELDS,
+                [
+                    (frappe.generate_hash(length=10), now, now, self.user, self.user, 0,
+                        conversation_id, now, "user", message, None),
+                    (frappe.generate_hash(length=10), reply_time, reply_time, self.user, self.user, 0,
+                        conversation_id, reply_time, "assistant", response.get("text", ""), actions_taken),
+                ]
+            )
             
-            # Update conversation last activity
-            conversation_doc.end_time = frappe.utils.now()
-            conversation_doc.save()
+            # Update conversation last activity; new conversations got it on insert
+            if not is_new:
+                frappe.db.set_value("Gemini Conversation", conversation_id, "end_time", reply_time, update_modified=False)
             
             return conversation_id
             
@@ -269,18 +305,33 @@ class GeminiContextManager:
             if to_delete <= 0:
                 return True
             
-            # Get oldest messages
-            old_messages = frappe.get_all(
-                "Gemini Message",
-                filters={"conversation": conversation_id},
-                fields=["name"],
-                order_by="timestamp asc",
-                limit=to_delete
-            )
-            
-            # Delete oldest messages
-            for msg in old_messages:
-                frappe.delete_doc("Gemini Message", msg.name)
+            # Delete oldest messages in a single statement. Messages with
+            # feedback are kept, as delete_doc's link check did, so no
+            # Gemini Feedback row is left pointing at a missing message.
+            keep_linked = """
+                AND name NOT IN (
+                    SELECT message FROM `tabGemini Feedback` WHERE message IS NOT NULL
+                )
+            """
+            
+            if frappe.db.db_type == "mariadb":
+                frappe.db.sql(f"""
+                    DELETE FROM `tabGemini Message`
+                    WHERE conversation = %s {keep_linked}
+                    ORDER BY timestamp ASC
+                    LIMIT %s
+                """, (conversation_id, to_delete))
+            else:
+                # DELETE ... ORDER BY ... LIMIT is MariaDB/MySQL-only
+                frappe.db.sql(f"""
+                    DELETE FROM `tabGemini Message`
+                    WHERE name IN (
+                        SELECT name FROM `tabGemini Message`
+                        WHERE conversation = %s {keep_linked}
+                        ORDER BY timestamp ASC
+                        LIMIT %s
+                    )
+                """, (conversation_id, to_delete))
             
             return True
             
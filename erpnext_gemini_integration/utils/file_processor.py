@@ -9,71 +9,361 @@ import json
 from frappe import _
 from frappe.utils import cint, get_site_config
 
-def extract_text_from_pdf(file_path):
+# PDF text extraction backend, probed once at import: PyMuPDF, then PyPDF2, then pdfplumber
+try:
+    import fitz
+    _PDF_BACKEND = ("fitz", fitz)
+except ImportError:
+    try:
+        import PyPDF2
+        _PDF_BACKEND = ("pypdf2", PyPDF2)
+    except ImportError:
+        try:
+            import pdfplumber
+            _PDF_BACKEND = ("pdfplumber", pdfplumber)
+        except ImportError:
+            _PDF_BACKEND = (None, None)
+
+# PDFs with fewer pages are always extracted in process
+PARALLEL_PDF_MIN_PAGES = 8
+
+# Pages joined per chunk when extract_text_from_pdf reads a whole file
+PDF_TEXT_CHUNK_PAGES = 64
+
+# Read buffer for CSV files, fewer read calls on large files
+CSV_READ_BUFFER_SIZE = 1 << 20
+
+# Field types that only shape the form layout and carry no value
+_LAYOUT_FIELDTYPES = frozenset(["Section Break", "Column Break", "Tab Break"])
+
+# Field types left out of document context, binary references or secrets
+_SKIP_FIELDTYPES = frozenset(["Attach", "Attach Image", "Signature", "Password"])
+
+# Longer text values are truncated in document context
+_MAX_VALUE_LEN = 2048
+
+# Redis hash holding the field information per doctype
+DOCTYPE_FIELDS_CACHE_KEY = "gemini:doctype_fields"
+
+# Redis hash holding the link and table fields per doctype
+RELATION_FIELDS_CACHE_KEY = "gemini:doctype_relation_fields"
+
+def _log_once(source, message, exc):
     """
-    Extract text from a PDF file
+    Log an error at most once per request for each source and exception type
+    
+    Keeps a broken doctype from filling the Error Log when it is hit in a loop.
+    
+    Args:
+        source (str): Function reporting the error
+        message (str): Error description
+        exc (Exception): The exception
+    """
+    logged = getattr(frappe.local, "gemini_logged_errors", None)
+    if logged is None:
+        logged = frappe.local.gemini_logged_errors = set()
+    
+    key = (source, type(exc).__name__)
+    if key in logged:
+        return
+    
+    logged.add(key)
+    frappe.log_error(f"{message}: {str(exc)}")
+
+def _get_fitz_page_text(page, mode="text"):
+    """
+    Get the text of a PyMuPDF page
+    
+    Args:
+        page: PyMuPDF page
+        mode (str): "text" for plain text, "blocks" for text grouped by layout block
+        
+    Returns:
+        str: Page text
+    """
+    if mode == "blocks":
+        return "\n".join(block[4] for block in page.get_text("blocks"))
+    
+    return page.get_text("text")
+
+def _extract_fitz_pages(file_path, start, stop, mode="text"):
+    """
+    Extract the text of a range of pages with PyMuPDF
+    
+    Runs in a worker process, so it opens its own handle on the file.
     
     Args:
         file_path (str): Path to the PDF file
+        start (int): Index of the first page
+        stop (int): Index after the last page
+        mode (str): Text extraction mode passed to _get_fitz_page_text
         
     Returns:
-        str: Extracted text
+        list: Text of each page in the range
     """
-    try:
-        # Try to import PyPDF2
-        import PyPDF2
+    with _PDF_BACKEND[1].open(file_path) as doc:
+        return [_get_fitz_page_text(doc[page_num], mode) for page_num in range(start, stop)]
+
+def _get_pdf_worker_count(n_pages):
+    """
+    Get the number of worker processes for parallel PDF extraction
+    
+    Each worker gets at least PARALLEL_PDF_MIN_PAGES pages.
+    
+    Args:
+        n_pages (int): Number of pages in the file
+        
+    Returns:
+        int: Number of workers, at least 1
+    """
+    return max(1, min(os.cpu_count() or 1, n_pages // PARALLEL_PDF_MIN_PAGES))
+
+def _extract_fitz_pages_parallel(file_path, n_pages, mode="text"):
+    """
+    Extract the text of all pages with PyMuPDF across a process pool
+    
+    Pages are split into one contiguous slice per worker and reassembled
+    in page order.
+    
+    Args:
+        file_path (str): Path to the PDF file
+        n_pages (int): Number of pages in the file
+        mode (str): Text extraction mode passed to _get_fitz_page_text
         
-        text = ""
+    Returns:
+        list: Text of each page
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    workers = _get_pdf_worker_count(n_pages)
+    step = -(-n_pages // workers)
+    ranges = [(start, min(start + step, n_pages)) for start in range(0, n_pages, step)]
+    
+    # Spawned workers don't inherit the database connection of the web or job process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_extract_fitz_pages, file_path, start, stop, mode) for start, stop in ranges]
+        return [text for future in futures for text in future.result()]
+
+def _iter_pdf_pages(file_path, mode="text"):
+    """
+    Read the text of a PDF file page by page with the available backend
+    
+    Args:
+        file_path (str): Path to the PDF file
+        mode (str): Text extraction mode passed to _get_fitz_page_text
+        
+    Yields:
+        str: Page text
+    """
+    backend, module = _PDF_BACKEND
+    
+    if backend == "fitz":
+        # Extraction runs in the MuPDF C engine
+        with module.open(file_path) as doc:
+            for page in doc:
+                yield _get_fitz_page_text(page, mode)
+    
+    elif backend == "pypdf2":
         with open(file_path, "rb") as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
+            for page in module.PdfReader(file, strict=False).pages:
+                yield page.extract_text() or ""
+    
+    elif backend == "pdfplumber":
+        # extract_text returns None for image only pages
+        with module.open(file_path) as pdf:
+            for page in pdf.pages:
+                yield page.extract_text() or ""
+
+def iter_pdf_chunks(file_path, pages_per_chunk=4, mode="text"):
+    """
+    Extract text from a PDF file in chunks of pages
+    
+    Only pages_per_chunk pages are held in memory at a time, so callers can
+    process each chunk while the rest of the file is still being read.
+    Read errors are raised while iterating.
+    
+    Args:
+        file_path (str): Path to the PDF file
+        pages_per_chunk (int, optional): Number of pages joined into each chunk
+        mode (str, optional): "text" for plain text, "blocks" to keep layout
+            blocks together. Only used by the PyMuPDF backend.
         
-        return text
-    except ImportError:
-        # If PyPDF2 is not available, try to use pdfplumber
-        try:
-            import pdfplumber
-            
-            text = ""
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    text += page.extract_text() + "\n\n"
+    Yields:
+        str: Text of up to pages_per_chunk consecutive pages
+    """
+    if not _PDF_BACKEND[0]:
+        frappe.log_error("PDF text extraction libraries (PyMuPDF, PyPDF2 or pdfplumber) not installed")
+        return
+    
+    pages_per_chunk = max(cint(pages_per_chunk), 1)
+    
+    chunk = []
+    for text in _iter_pdf_pages(file_path, mode):
+        chunk.append(text)
+        if len(chunk) == pages_per_chunk:
+            yield "\n\n".join(chunk)
+            chunk = []
+    
+    if chunk:
+        yield "\n\n".join(chunk)
+
+def extract_text_from_pdf(file_path, mode="text"):
+    """
+    Extract text from a PDF file
+    
+    Args:
+        file_path (str): Path to the PDF file
+        mode (str, optional): "text" for plain text, "blocks" to keep layout
+            blocks together. Only used by the PyMuPDF backend.
+        
+    Returns:
+        str: Extracted text
+    """
+    backend, module = _PDF_BACKEND
+    
+    if not backend:
+        frappe.log_error("PDF text extraction libraries (PyMuPDF, PyPDF2 or pdfplumber) not installed")
+        return "PDF text extraction failed. Required libraries not installed."
+    
+    try:
+        # Large files can be split across processes when enabled in site config
+        if backend == "fitz" and cint(get_site_config().get("gemini_parallel_pdf_extraction")):
+            with module.open(file_path) as doc:
+                n_pages = doc.page_count
             
-            return text
-        except ImportError:
-            # If neither library is available, log error and return empty string
-            frappe.log_error("PDF text extraction libraries (PyPDF2 or pdfplumber) not installed")
-            return "PDF text extraction failed. Required libraries not installed."
+            # A single worker would only add interpreter start up to the serial work
+            if _get_pdf_worker_count(n_pages) >= 2:
+                return "\n\n".join(_extract_fitz_pages_parallel(file_path, n_pages, mode))
+        
+        return "\n\n".join(iter_pdf_chunks(file_path, pages_per_chunk=PDF_TEXT_CHUNK_PAGES, mode=mode))
     except Exception as e:
         frappe.log_error(f"Error extracting text from PDF: {str(e)}")
         return f"PDF text extraction failed: {str(e)}"
 
-def extract_data_from_csv(file_path):
+def _read_csv_header(file_path):
+    """
+    Read the header row of a CSV file
+    
+    Args:
+        file_path (str): Path to the CSV file
+        
+    Returns:
+        list: Column names, empty for an empty file
+    """
+    import csv
+    
+    with open(file_path, 'r', newline='', encoding='utf-8') as file:
+        return next(csv.reader(file), None) or []
+
+def _iter_csv_rows(file_path):
+    """
+    Read a CSV file row by row
+    
+    Args:
+        file_path (str): Path to the CSV file
+        
+    Yields:
+        dict: CSV row
+    """
+    import csv
+    
+    with open(file_path, 'r', newline='', encoding='utf-8', buffering=CSV_READ_BUFFER_SIZE) as file:
+        csv_reader = csv.reader(file)
+        header = next(csv_reader, None)
+        if not header:
+            return
+        
+        # Like DictReader, skip blank lines
+        for row in csv_reader:
+            if row:
+                yield dict(zip(header, row))
+
+def extract_data_from_csv(file_path, lazy=False, stream=False):
     """
     Extract data from a CSV file
     
     Args:
         file_path (str): Path to the CSV file
+        lazy (bool, optional): Return a polars LazyFrame instead of reading
+            the file, so large files are only scanned when collected.
+            Ignored when polars is not installed.
+        stream (bool, optional): Return a generator of rows instead of a list,
+            keeping memory use constant. Read errors are raised while iterating.
         
     Returns:
-        list: List of dictionaries representing CSV rows
+        list: List of dictionaries representing CSV rows, a generator when
+            stream is set, or a LazyFrame when lazy is set
     """
+    if stream:
+        return _iter_csv_rows(file_path)
+    
+    # Every column is read as text, like the csv module, so values such as
+    # leading zero item codes survive and blanks stay empty strings
+    try:
+        # Try polars first, its parser is multi threaded and native
+        import polars as pl
+        
+        if lazy:
+            return pl.scan_csv(file_path, infer_schema_length=0, missing_utf8_is_empty_string=True)
+        
+        return pl.read_csv(file_path, infer_schema_length=0, missing_utf8_is_empty_string=True).to_dicts()
+    except ImportError:
+        pass
+    except Exception as e:
+        # Fall through, the csv module is more lenient with malformed files
+        frappe.logger().warning(f"polars could not parse CSV {file_path}: {str(e)}")
+    
     try:
-        import csv
+        # Fall back to pyarrow
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+        
+        header = _read_csv_header(file_path)
+        if not header:
+            return []
         
-        data = []
-        with open(file_path, 'r', newline='', encoding='utf-8') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                data.append(dict(row))
+        convert_options = pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in header},
+            strings_can_be_null=False
+        )
         
-        return data
+        return pa_csv.read_csv(file_path, convert_options=convert_options).to_pylist()
+    except ImportError:
+        pass
+    except Exception as e:
+        # Fall through, the csv module is more lenient with malformed files
+        frappe.logger().warning(f"pyarrow could not parse CSV {file_path}: {str(e)}")
+    
+    try:
+        return list(_iter_csv_rows(file_path))
     except Exception as e:
         frappe.log_error(f"Error extracting data from CSV: {str(e)}")
         return []
 
+def _build_doctype_fields(doctype):
+    """
+    Build the field information of a DocType from its meta
+    
+    Args:
+        doctype (str): DocType name
+        
+    Returns:
+        list: List of field information
+    """
+    return [
+        {
+            "fieldname": field.fieldname,
+            "label": field.label,
+            "fieldtype": field.fieldtype,
+            "options": field.options,
+            "reqd": field.reqd,
+            "hidden": field.hidden,
+            "description": field.description
+        }
+        for field in frappe.get_meta(doctype).fields
+    ]
+
 def get_doctype_fields(doctype):
     """
     Get fields for a DocType
@@ -85,25 +375,65 @@ def get_doctype_fields(doctype):
         list: List of field information
     """
     try:
-        meta = frappe.get_meta(doctype)
-        fields = []
-        
-        for field in meta.fields:
-            fields.append({
-                "fieldname": field.fieldname,
-                "label": field.label,
-                "fieldtype": field.fieldtype,
-                "options": field.options,
-                "reqd": field.reqd,
-                "hidden": field.hidden,
-                "description": field.description
-            })
-        
-        return fields
+        return frappe.cache().hget(
+            DOCTYPE_FIELDS_CACHE_KEY,
+            doctype,
+            generator=lambda: _build_doctype_fields(doctype)
+        )
     except Exception as e:
-        frappe.log_error(f"Error getting DocType fields: {str(e)}")
+        _log_once("get_doctype_fields", "Error getting DocType fields", e)
         return []
 
+def clear_doctype_fields_cache(doc=None, method=None):
+    """
+    Drop cached DocType fields when a DocType or its customizations change
+    
+    Args:
+        doc (Document, optional): Document that triggered the event
+        method (str, optional): Name of the event
+    """
+    frappe.cache().delete_key(DOCTYPE_FIELDS_CACHE_KEY)
+    frappe.cache().delete_key(RELATION_FIELDS_CACHE_KEY)
+
+def _build_relation_fields(doctype):
+    """
+    Build the link and table fields of a DocType from its meta
+    
+    Args:
+        doctype (str): DocType name
+        
+    Returns:
+        dict: Lists of fieldname, label and options under "links" and "tables"
+    """
+    meta = frappe.get_meta(doctype)
+    
+    def describe(fields):
+        return [
+            {"fieldname": field.fieldname, "label": field.label, "options": field.options}
+            for field in fields
+        ]
+    
+    return {
+        "links": describe(meta.get_link_fields()),
+        "tables": describe(meta.get_table_fields())
+    }
+
+def get_relation_fields(doctype):
+    """
+    Get the link and table fields of a DocType
+    
+    Args:
+        doctype (str): DocType name
+        
+    Returns:
+        dict: Lists of fieldname, label and options under "links" and "tables"
+    """
+    return frappe.cache().hget(
+        RELATION_FIELDS_CACHE_KEY,
+        doctype,
+        generator=lambda: _build_relation_fields(doctype)
+    )
+
 def detect_active_doctype():
     """
     Detect the active DocType based on the current page
@@ -120,10 +450,54 @@ def detect_active_doctype():
         frappe.log_error(f"Error detecting active DocType: {str(e)}")
         return None
 
+def _trim_value(value):
+    """
+    Truncate long text values for document context
+    
+    Args:
+        value: Field value
+        
+    Returns:
+        Value, with strings over _MAX_VALUE_LEN cut and marked with "…"
+    """
+    if isinstance(value, str) and len(value) > _MAX_VALUE_LEN:
+        return value[:_MAX_VALUE_LEN] + "…"
+    
+    return value
+
 def get_document_context(doctype, docname):
     """
     Get context information for a document
     
+    Built once per request for each document and user.
+    
+    Args:
+        doctype (str): DocType name
+        docname (str): Document name
+        
+    Returns:
+        dict: Document context information
+    """
+    cache = getattr(frappe.local, "gemini_document_context", None)
+    if cache is None:
+        cache = frappe.local.gemini_document_context = {}
+    
+    key = (frappe.session.user, doctype, docname)
+    if key not in cache:
+        context = _build_document_context(doctype, docname)
+        
+        # Errors may be transient, only keep built contexts
+        if context.get("error"):
+            return context
+        
+        cache[key] = context
+    
+    return cache[key]
+
+def _build_document_context(doctype, docname):
+    """
+    Build context information for a document
+    
     Args:
         doctype (str): DocType name
         docname (str): Document name
@@ -132,49 +506,55 @@ def get_document_context(doctype, docname):
         dict: Document context information
     """
     try:
-        # Check permissions
-        if not frappe.has_permission(doctype, "read", docname):
+        meta = frappe.get_meta(doctype)
+        
+        # Get document, served from the document cache on repeated turns
+        doc = frappe.get_cached_doc(doctype, docname)
+        
+        # Check permissions against the loaded document so it isn't fetched again
+        if not frappe.has_permission(doctype, "read", doc):
             return {
                 "error": True,
                 "message": f"No permission to read {doctype} {docname}"
             }
         
-        # Get document
-        doc = frappe.get_doc(doctype, docname)
-        
         # Get fields that the user has permission to read
-        fields = {}
-        meta = frappe.get_meta(doctype)
+        values = doc.__dict__
+        
+        fields = {
+            field.fieldname: {
+                "label": field.label,
+                "value": _trim_value(values[field.fieldname]),
+                "type": field.fieldtype
+            }
+            for field in meta.fields
+            if field.fieldtype not in _LAYOUT_FIELDTYPES
+            and field.fieldtype not in _SKIP_FIELDTYPES
+            and field.fieldname in values
+        }
         
-        for field in meta.fields:
-            if field.fieldtype not in ["Section Break", "Column Break", "Tab Break"]:
-                # Check field level permissions if applicable
-                if hasattr(doc, field.fieldname):
-                    fields[field.fieldname] = {
-                        "label": field.label,
-                        "value": doc.get(field.fieldname),
-                        "type": field.fieldtype
-                    }
+        relation_fields = get_relation_fields(doctype)
         
         # Get linked documents
-        links = {}
-        for link_field in meta.get_link_fields():
-            if hasattr(doc, link_field.fieldname) and doc.get(link_field.fieldname):
-                links[link_field.fieldname] = {
-                    "doctype": link_field.options,
-                    "name": doc.get(link_field.fieldname)
-                }
+        links = {
+            link_field["fieldname"]: {
+                "doctype": link_field["options"],
+                "name": values[link_field["fieldname"]]
+            }
+            for link_field in relation_fields["links"]
+            if values.get(link_field["fieldname"])
+        }
         
         # Get child tables
-        child_tables = {}
-        for child_table in meta.get_table_fields():
-            if hasattr(doc, child_table.fieldname):
-                child_docs = doc.get(child_table.fieldname)
-                child_tables[child_table.fieldname] = {
-                    "label": child_table.label,
-                    "count": len(child_docs),
-                    "doctype": child_table.options
-                }
+        child_tables = {
+            child_table["fieldname"]: {
+                "label": child_table["label"],
+                "count": len(values[child_table["fieldname"]] or []),
+                "doctype": child_table["options"]
+            }
+            for child_table in relation_fields["tables"]
+            if child_table["fieldname"] in values
+        }
         
         return {
             "doctype": doctype,
@@ -185,7 +565,7 @@ def get_document_context(doctype, docname):
         }
         
     except Exception as e:
-        frappe.log_error(f"Error getting document context: {str(e)}")
+        _log_once("get_document_context", "Error getting document context", e)
         return {
             "error": True,
             "message": f"Error: {str(e)}"
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, Golive-Solutions and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj):
+    """
+    Serialize an object to a JSON string, using orjson when it is installed
+
+    Args:
+        obj: Object to serialize
+
+    Returns:
+        str: JSON string
+    """
+    if orjson:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    return json.dumps(obj, default=str)
+
+def loads(text):
+    """
+    Parse a JSON string, using orjson when it is installed
+
+    Args:
+        text (str or bytes): JSON string
+
+    Returns:
+        Parsed object
+    """
+    if orjson:
+        return orjson.loads(text)
+
+    return json.loads(text)